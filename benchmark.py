@@ -0,0 +1,188 @@
+# -*- coding: utf8 -*-
+"""Golden-output regression harness for the matcher.
+
+Runs the full `products.txt` x `listings.txt` pipeline (product `Tree` and `BinaryNode` search tree), diffs
+every listing's match decision against a stored golden baseline (`data/golden_matches.txt`) and reports
+throughput, `find` latency percentiles and peak memory alongside it. A speed-up is only worth having if the golden diff stays empty.
+
+    python benchmark.py                        # full data set, compare with the golden baseline
+    python benchmark.py --mode insert          # build the tree with recursive `Tree.insert` calls instead of `Tree.build`
+    python benchmark.py --listing-scale 10     # synthetic scale: every listing is matched 10 times
+    python benchmark.py --product-scale 100    # synthetic scale: 99 extra, never-matching copies of the catalog
+    python benchmark.py --product-scale 100 --scale-kind model   # same, but the copies sit under the real families
+    python benchmark.py --update-golden        # (re)write the golden baseline from the current code
+
+The golden file has one line per listing (in `listings.txt` order) holding the matched `product_name`,
+or an empty line if the listing has no match. It was generated with `--mode insert` from the `models.py`
+of the baseline commit (7c6f6c3), before any of the tree or normalization optimisations.
+"""
+import argparse
+import codecs
+import json
+import math
+import resource
+import sys
+from timeit import default_timer as timer
+
+from models import BinaryNode
+from models import Listing
+from models import Product
+from models import Tree
+
+PRODUCTS_PATH = 'data/products.txt'
+LISTINGS_PATH = 'data/listings.txt'
+GOLDEN_PATH = 'data/golden_matches.txt'
+MODES = ('build', 'insert')
+SCALE_KINDS = ('manufacturer', 'model')
+
+def load_products(path=PRODUCTS_PATH, scale=1, kind='manufacturer'):
+    """Loads the products. For `scale > 1` the catalog is padded with `scale - 1` synthetic copies that never
+    match a listing, so the golden decisions still hold. `kind` decides where the copies sit in the tree:
+
+        - `manufacturer`: the manufacturer is prefixed with `Synthetic<n>`. No listing manufacturer contains it,
+          so `find` drops the copies at the root. This only adds root fan-out.
+        - `model`: manufacturer and family are kept and the model is suffixed with `Synthetic<n>`. The copies
+          go through the family and model ranking of every matching listing, and make the search tree deeper.
+    """
+    if kind not in SCALE_KINDS:
+        raise Exception('Unknown scale kind %s' % kind)
+    rows = [row for row in open(path, 'rU')]
+    products = [Product(row) for row in rows]
+    for copy in range(1, scale):
+        for row in rows:
+            product_data = json.loads(row)
+            if kind == 'manufacturer':
+                product_data['product_name'] = u'Synthetic%d_%s' % (copy, product_data['product_name'])
+                product_data['manufacturer'] = u'Synthetic%d %s' % (copy, product_data['manufacturer'])
+            else:
+                product_data['product_name'] = u'%s_Synthetic%d' % (product_data['product_name'], copy)
+                product_data['model'] = u'%s Synthetic%d' % (product_data['model'], copy)
+            products.append(Product(json.dumps(product_data)))
+    return products
+
+def load_listings(path=LISTINGS_PATH):
+    return [row for row in open(path, 'rU')]
+
+def build_tree(products, mode='build'):
+    """Builds the product tree with one of the two construction paths: `build` groups all products in a single
+    `Tree.build` walk, `insert` calls the recursive `Tree.insert` once per product. Both must give the same tree.
+    """
+    if mode == 'build':
+        return Tree.build(products)
+    elif mode == 'insert':
+        tree = Tree()
+        for product in products:
+            tree.insert(product)
+        return tree
+    else:
+        raise Exception('Unknown mode %s' % mode)
+
+def build_search_tree(products):
+    """Builds the `BinaryNode` search tree used to aggregate the matches, as `main.py` does.
+    """
+    search_tree = BinaryNode(products[0])
+    for product in products[1:]:
+        search_tree.insert(product)
+    return search_tree
+
+def run_matches(tree, listing_rows, scale=1, search_tree=None):
+    """Matches every listing row (`scale` times over) against `tree` and, if a `search_tree` is given, adds each
+    match to it as a payload, as `main.py` does.
+
+    Returns the list of decisions (matched `product_name` or None) for the first pass over `listing_rows`,
+    the `find` latencies in seconds for every pass, and the total elapsed time (parsing included).
+    """
+    decisions = []
+    latencies = []
+    start = timer()
+    for iteration in range(scale):
+        for listing_row in listing_rows:
+            listing = Listing(listing_row)
+            find_start = timer()
+            match = tree.find(listing)
+            latencies.append(timer() - find_start)
+            if match is not None and search_tree is not None:
+                search_tree.insert_payload(data=match, payload=listing.original_string)
+            if iteration == 0:
+                decisions.append(match.product_name if match is not None else None)
+    return decisions, latencies, timer() - start
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list.
+    """
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[max(0, int(math.ceil(fraction * len(sorted_values))) - 1)]
+
+def read_golden(path=GOLDEN_PATH):
+    with codecs.open(path, 'r', encoding='utf-8') as golden_file:
+        return [line.rstrip(u'\n') or None for line in golden_file]
+
+def write_golden(decisions, path=GOLDEN_PATH):
+    with codecs.open(path, 'w', encoding='utf-8') as golden_file:
+        for decision in decisions:
+            golden_file.write((decision or u'') + u'\n')
+
+def compare(decisions, golden):
+    """Returns a list of `(listing_index, expected, found)` for every listing whose decision differs from
+    the golden baseline. A differing number of listings is reported against the missing index with `found`
+    (or `expected`) set to the string `'<missing>'`.
+    """
+    mismatches = []
+    for index in range(max(len(decisions), len(golden))):
+        expected = golden[index] if index < len(golden) else '<missing>'
+        found = decisions[index] if index < len(decisions) else '<missing>'
+        if expected != found:
+            mismatches.append((index, expected, found))
+    return mismatches
+
+def peak_memory_mb():
+    """Peak resident memory of this process (`ru_maxrss` is in kilobytes on Linux).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def main():
+    parser = argparse.ArgumentParser(description='Golden-output performance regression harness for the matcher.')
+    parser.add_argument('--mode', choices=MODES, default='build', help='how the product tree is constructed')
+    parser.add_argument('--products', default=PRODUCTS_PATH)
+    parser.add_argument('--listings', default=LISTINGS_PATH)
+    parser.add_argument('--golden', default=GOLDEN_PATH)
+    parser.add_argument('--product-scale', type=int, default=1, help='pad the catalog with N-1 synthetic, never-matching copies')
+    parser.add_argument('--scale-kind', choices=SCALE_KINDS, default='manufacturer', help='where the synthetic copies sit in the tree')
+    parser.add_argument('--listing-scale', type=int, default=1, help='match every listing N times')
+    parser.add_argument('--update-golden', action='store_true', help='write the golden baseline instead of comparing with it')
+    parser.add_argument('--show', type=int, default=10, help='number of mismatches to print')
+    args = parser.parse_args()
+
+    start = timer()
+    products = load_products(args.products, args.product_scale, args.scale_kind)
+    load_time = timer() - start
+    start = timer()
+    tree = build_tree(products, args.mode)
+    search_tree = build_search_tree(products)
+    build_time = timer() - start
+
+    listing_rows = load_listings(args.listings)
+    decisions, latencies, match_time = run_matches(tree, listing_rows, args.listing_scale, search_tree)
+    latencies.sort()
+
+    print 'Mode: %s, product scale: %d (%s), listing scale: %d' % (args.mode, args.product_scale, args.scale_kind, args.listing_scale)
+    print 'Products: %d loaded in %.3fs, trees built in %.3fs' % (len(products), load_time, build_time)
+    print 'Listings: %d matched in %.3fs (%.0f listings/s)' % (len(latencies), match_time, len(latencies) / match_time if match_time else 0.0)
+    print 'find latency (ms): p50 %.3f, p90 %.3f, p99 %.3f, max %.3f' % tuple(
+        1000 * percentile(latencies, fraction) for fraction in (0.50, 0.90, 0.99, 1.0))
+    print 'Peak memory: %.1f MB' % peak_memory_mb()
+
+    if args.update_golden:
+        write_golden(decisions, args.golden)
+        print 'Golden: wrote %d decisions to %s' % (len(decisions), args.golden)
+        return 0
+
+    mismatches = compare(decisions, read_golden(args.golden))
+    print 'Golden: %d listings, %d mismatches' % (len(decisions), len(mismatches))
+    for index, expected, found in mismatches[:args.show]:
+        print (u'  listing %d: expected %s, found %s' % (index, expected, found)).encode('utf-8')
+    return 1 if mismatches else 0
+
+if __name__ == u'__main__':
+    sys.exit(main())
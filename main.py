@@ -16,10 +16,9 @@ def main():
     # 1. product_tree is the 4-level tree used to split product data for ranking purposes
     # 2. product_search_tree is the Binary Search tree used to quickly aggregate the results and output them 
     print 'Constructing trees'
-    product_tree = Tree()
-    for index, prod in enumerate(products_data):
-        product = Product(prod)
-        product_tree.insert(product)
+    products = [Product(prod) for prod in products_data]
+    product_tree = Tree.build(products)
+    for index, product in enumerate(products):
         if index == 0:
             product_search_tree = BinaryNode(product)
         else:
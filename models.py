@@ -1,6 +1,7 @@
 # -*- coding: utf8 -*-
 
 import json
+import re
 
 class Item(object):
     """Pseudo-abstract class. Mainly used to provide string-related functions to process the data. These
@@ -9,6 +10,10 @@ class Item(object):
     costs and therefore its important for them to only be loaded once"""
 
     delchars = ''.join(c for c in map(chr, range(256)) if ( (not c.isalnum()) and (c not in ('.')) ) )
+    delchars_pattern = re.compile(u'[%s]' % re.escape(delchars.decode('latin-1'))) # unicode version of `delchars`
+    token_pattern = re.compile(u'[^%s]+' % re.escape(delchars.decode('latin-1'))) # runs of characters kept by `purify`
+    interned = {} # purified manufacturer and family strings, shared by every `Listing` and `Product`
+    interned_limit = 10000 # past this many entries, `purify_interned` stops caching new strings
 
     @classmethod
     def remove_non_alpha_characters(cls, dirty_string):
@@ -18,8 +23,7 @@ class Item(object):
         By `flat_string` we mean a string with only alphanumeric characters (no spaces, dashes or periods).
         """
         if isinstance(dirty_string, unicode):
-            translate_table = dict((ord(char), None) for char in cls.delchars)
-            return dirty_string.translate(translate_table)
+            return cls.delchars_pattern.sub(u'', dirty_string)
         else:
             assert isinstance(dirty_string, str)
             return dirty_string.translate(None, cls.delchars)
@@ -30,6 +34,49 @@ class Item(object):
         """
         return cls.remove_non_alpha_characters(dirty_string).lower()
 
+    @classmethod
+    def purify_interned(cls, dirty_string):
+        """Same as `purify`, but caches the result in `interned`. Only meant for manufacturer and family strings,
+        which repeat across thousands of listings and products. The cache is keyed on the type as well, so `str`
+        input still gives `str` output and `unicode` gives `unicode`. It stops growing at `interned_limit` entries.
+        """
+        key = (type(dirty_string), dirty_string)
+        try:
+            return cls.interned[key]
+        except KeyError:
+            pure_string = cls.purify(dirty_string)
+            if len(cls.interned) < cls.interned_limit:
+                cls.interned[key] = pure_string
+            return pure_string
+
+    @classmethod
+    def normalize(cls, dirty_string, separators=()):
+        """Normalizes a (title) unicode string. It is split once (by `token_pattern`) into the runs of characters
+        `purify` keeps, and like `purify` the tokens are only lowered after that. Returns a tuple of:
+
+            - the purified string (the tokens joined together, same as `purify`)
+            - the list of lowered tokens
+            - a dictionary mapping each separator found in the lowered string to its position
+            - the purified text before the last found separator (in `separators` order), or None
+
+        As before, separators are found in the lowered title and the text before the last one is lowered before it
+        is purified. Only that text is scanned again, to build the last item.
+        """
+        # tokens never contain a space, so they can be lowered in one go and split back apart
+        tokens = u' '.join(cls.token_pattern.findall(dirty_string)).lower().split(u' ')
+        if tokens == [u'']:
+            tokens = []
+
+        lowered = dirty_string.lower()
+        separator_positions = {}
+        position = -1
+        for sep in separators:
+            sep_position = lowered.find(sep)
+            if sep_position != -1:
+                separator_positions[sep] = position = sep_position
+        sub_string = u''.join(cls.token_pattern.findall(lowered, 0, position)) if position != -1 else None
+        return u''.join(tokens), tokens, separator_positions, sub_string
+
 class Listing(Item):
     """Object that contains information for a listing.
 
@@ -37,6 +84,9 @@ class Listing(Item):
         - `original_string`: The original json string
         - `title`: title portion of json string
         - `title_pure`: purified title
+        - `title_tokens`: runs of characters kept in the purified title
+        - `separator_positions`: positions of the `title_separators` found in the lowered title
+        - `sub_title`: purified part of the title before a separator, or None
         - `manufacturer`: manufacturer portion of json string
         - `manufacturer_pure`: purified manufacturer
     """
@@ -55,15 +105,12 @@ class Listing(Item):
         listing_data = json.loads(json_string_listing)
         self.original_string = json_string_listing
         self.title = listing_data['title']
-        self.title_pure = self.__class__.purify(self.title)
         self.manufacturer = listing_data['manufacturer']
-        self.manufacturer_pure = self.__class__.purify(listing_data['manufacturer'])
+        self.manufacturer_pure = self.__class__.purify_interned(listing_data['manufacturer'])
 
-        # find the important part of the title by splitting on title_separators
-        self.sub_title = None
-        for sep in self.__class__.title_separators:
-            if len(self.title.lower().split(sep))>1:
-                self.sub_title = self.__class__.purify(self.title.lower().split(sep)[0])
+        # purify and tokenize the title, and find the important part of it (`sub_title`) by splitting on title_separators
+        self.title_pure, self.title_tokens, self.separator_positions, self.sub_title = \
+            self.__class__.normalize(self.title, self.__class__.title_separators)
 
     def __unicode__(self):
         """Returns a unicode version of the string. Used for debugging
@@ -96,10 +143,10 @@ class Product(Item):
         product_data = json.loads(json_string_listing)
         self.product_name = product_data['product_name']
         self.manufacturer = product_data['manufacturer']
-        self.manufacturer_pure = self.purify(product_data['manufacturer'])
+        self.manufacturer_pure = self.purify_interned(product_data['manufacturer'])
         if 'family' in product_data:
             self.family = product_data['family']
-            self.family_pure = self.purify(product_data['family'])
+            self.family_pure = self.purify_interned(product_data['family'])
         else:
             self.family = None
             self.family_pure = None
@@ -200,15 +247,40 @@ class Tree(object):
     """
 
     _type = 'god' 
+    _child_type = 'manufacturer'
     _append = '_pure'
 
     def __init__(self, product=None):
         self._children = []
+        self._index = {} # maps a child's `_id` to the child, so `insert` doesn't scan `_children`
         if product is not None:
             self._id = product.__dict__[self.__class__._type + self.__class__._append] if self.__class__._type is not None else None
-            self._children.append(NodeFactory(self.__class__, product))
+            self.insert(product)
         else:
             self._id = None
+
+    @classmethod
+    def build(cls, products):
+        """Bulk constructor for the root tree. Walks `products` once and groups them by manufacturer, family and model:
+        each product follows the `_index` of those three levels down to its `ModelNode`, without the recursive
+        `insert` calls. The first product of a new group has the rest of its branch created by `NodeFactory`.
+        Children keep the order in which they were first seen, so the tree (and therefore matching) is identical
+        to one built with `insert`.
+        """
+        tree = cls()
+        for product in products:
+            node = tree
+            for key in (product.manufacturer_pure, product.family_pure, product.model_pure):
+                child = node._index.get(key)
+                if child is None:
+                    child = NodeFactory(node.__class__, product)
+                    node._index[key] = child
+                    node._children.append(child)
+                    break
+                node = child
+            else:
+                node.insert(product)
+        return tree
     
     def _get_rank(self, product_dict):
         return product_dict['manufacturer'] * (product_dict['family'] + product_dict['model'])
@@ -297,19 +369,22 @@ class Tree(object):
             return collector 
 
     def insert(self, product):
-        """Method to recursively add nodes to the tree.
+        """Method to recursively add nodes to the tree. Children are looked up by `_id` in `_index`
+        rather than by scanning `_children`.
         """
-        match = False
-        for child in self._children:
-            if child._id == product.__dict__[child._type + self.__class__._append]:
-                match = True
-                child.insert(product) 
-        if not match:
-            self._children.append(NodeFactory(self.__class__, product))
+        key = product.__dict__[self.__class__._child_type + self.__class__._append]
+        child = self._index.get(key)
+        if child is not None:
+            child.insert(product)
+        else:
+            child = NodeFactory(self.__class__, product)
+            self._index[key] = child
+            self._children.append(child)
 
 class ManufacturerNode(Tree):
    
     _type = 'manufacturer'
+    _child_type = 'family'
 
     def rank_calc(self, listing):
         return len(self._id) if self._id in listing.manufacturer_pure else 0
@@ -331,6 +406,7 @@ class ManufacturerNode(Tree):
 class FamilyNode(Tree):
 
     _type = 'family'
+    _child_type = 'model'
 
     def rank_calc(self, listing):
         if self._id is not None:
@@ -357,7 +433,9 @@ class ModelNode(Tree):
 
 
     def insert(self, product):
-        if product not in self._children:
+        # Products compare equal on `product_name`, so index them by it.
+        if product.product_name not in self._index:
+            self._index[product.product_name] = product
             self._children.append(product)
 
 class BinaryNode(object):
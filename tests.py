@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import json
+import os
 import unittest
+import benchmark
 from models import BinaryNode
 from models import Item
 from models import Listing
@@ -10,6 +12,16 @@ from models import Tree
 
 class TestItem(unittest.TestCase):
 
+    def setUp(self):
+        # `interned` and `interned_limit` are class-level state, so give every test a clean cache
+        self.interned = Item.interned
+        self.interned_limit = Item.interned_limit
+        Item.interned = {}
+
+    def tearDown(self):
+        Item.interned = self.interned
+        Item.interned_limit = self.interned_limit
+
     def test_removal_of_special_characters(self):
         item = Item()
         test_string = 'hello%(*)@$)(aaa333$$$%%%^^^&&&aaa333!@#$%^&*()-_\]}[{;:\'"?/.>,<'
@@ -22,6 +34,40 @@ class TestItem(unittest.TestCase):
         self.assertEqual(item.purify(test_string), 'aaronlevin')
         del item
 
+    def test_purify_is_interned(self):
+        self.assertTrue(Item.purify_interned(u'Canon Canada') is Item.purify_interned(u'Canon Canada'))
+        self.assertTrue(Listing.purify_interned(u'Canon') is Product.purify_interned(u'Canon'))
+        self.assertFalse(Item.purify(u'Canon') is Item.purify(u'Canon'))
+
+    def test_purify_interned_keeps_input_type(self):
+        self.assertEqual(type(Item.purify_interned(u'Canon')), unicode)
+        self.assertEqual(type(Item.purify_interned('Canon')), str)
+        self.assertEqual(type(Item.purify_interned('Nikon')), str)
+        self.assertEqual(type(Item.purify_interned(u'Nikon')), unicode)
+
+    def test_purify_interned_limit(self):
+        Item.interned_limit = 1
+        self.assertEqual(Item.purify_interned(u'Canon'), u'canon')
+        self.assertEqual(Item.purify_interned(u'Nikon'), u'nikon')
+        self.assertEqual(Item.interned.keys(), [(unicode, u'Canon')])
+
+    def test_normalize(self):
+        pure, tokens, positions, sub_pure = Item.normalize(u'Canon PowerShot SX130-IS 12.1 MP Camera with 12x Zoom for Kids', ('with', 'for', 'avec'))
+        self.assertEqual(pure, Item.purify(u'Canon PowerShot SX130-IS 12.1 MP Camera with 12x Zoom for Kids'))
+        self.assertEqual(tokens, [u'canon', u'powershot', u'sx130', u'is', u'12.1', u'mp', u'camera', u'with', u'12x', u'zoom', u'for', u'kids'])
+        self.assertEqual(positions, {'with': 40, 'for': 54})
+        self.assertEqual(sub_pure, u'canonpowershotsx130is12.1mpcamerawith12xzoom')
+        self.assertEqual(Item.normalize(u'Canon EOS 400D', ('with',)), (u'canoneos400d', [u'canon', u'eos', u'400d'], {}, None))
+        # characters outside latin-1 can lower into `delchars`, so the title is purified before it is lowered
+        title = u'ABC\u0178x with x'
+        self.assertEqual(Item.normalize(title, ('with',))[0], Item.purify(title))
+        self.assertEqual(Item.normalize(title, ('with',))[0], u'abc\xffxwithx')
+        self.assertEqual(Item.normalize(title, ('with',))[1], [u'abc\xffx', u'with', u'x'])
+        self.assertEqual(Item.normalize(title, ('with',))[3], Item.purify(title.lower().split('with')[0]))
+        self.assertEqual(Item.normalize(u'', ('with',)), (u'', [], {}, None))
+        # separators can start mid-word, the prefix is cut there
+        self.assertEqual(Item.normalize(u'Nikon Platform', ('for',))[3], u'nikonplat')
+
 class TestListingClass(unittest.TestCase):
 
     def setUp(self):
@@ -127,6 +173,24 @@ class TestBinaryProductsAndListings(unittest.TestCase):
         self.assertEqual(casio_model_2._type,'model')
         self.assertEqual(casio_model_2._id,'exh20g')
 
+    def test_insert_indexes_children(self):
+        self.assertEqual(self.tree._index['nikon'], self.tree._children[0])
+        self.assertEqual(self.tree._index['casio'], self.tree._children[1])
+        self.assertEqual(self.tree._index['casio']._index[None], self.tree._children[1]._children[0])
+        self.assertEqual(self.tree._index['casio']._index['exilim']._index['exh20g']._children[0], self.test_product_3)
+
+    def test_insert_duplicate_product(self):
+        self.tree.insert(Product('{"product_name":"Nikon-s6100","manufacturer":"Nikon","model":"S6100","family":"Coolpix","announced-date":"2011-02-08T19:00:00.000-05:00"}'))
+        self.assertEqual(len(self.tree._children), 2)
+        self.assertEqual(len(self.tree._children[0]._children[0]._children[0]._children), 1)
+
+    def test_build_matches_insert(self):
+        built_tree = Tree.build([self.test_product_1, self.test_product_2_no_family, self.test_product_3])
+        self.assertEqual([child._id for child in built_tree._children], [child._id for child in self.tree._children])
+        self.assertEqual([child._id for child in built_tree._children[1]._children], [None, 'exilim'])
+        listing = Listing('{"title":"Casio Exilim EX-H20G EXILIM Hi-Zoom; 14.1 MP; 4320 x 3240 pixels; 4 x; 10 x; 3.2 - 5.7; 3.2 - 7.5 (EX-H20GSREDA)","manufacturer":"CASIO","currency":"GBP","price":"246.24"}')
+        self.assertEqual(built_tree.find(listing), self.tree.find(listing))
+
     def test_find_returns_product(self):
         self.assertEqual(isinstance(self.tree.find(Listing('{"title":"Casio Exilim EX-H20G EXILIM Hi-Zoom; 14.1 MP; 4320 x 3240 pixels; 4 x; 10 x; 3.2 - 5.7; 3.2 - 7.5 (EX-H20GSREDA)","manufacturer":"CASIO","currency":"GBP","price":"246.24"}')),Product), True)
 
@@ -195,6 +259,37 @@ class TestBinarySearchTree(unittest.TestCase):
         self.numeric_tree.traverse_with_action(lambda x: node_counter.append(1))
         self.assertEqual(len(node_counter), 7) # 7 to account for initial null node.
  
+class TestGoldenMatches(unittest.TestCase):
+
+    def test_compare(self):
+        self.assertEqual(benchmark.compare([u'a', None, u'c'], [u'a', None, u'c']), [])
+        self.assertEqual(benchmark.compare([u'a', u'b'], [u'a', None, u'c']), [(1, None, u'b'), (2, u'c', '<missing>')])
+
+    def test_percentile(self):
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 0.9), 4)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 0.0), 1)
+        self.assertEqual(benchmark.percentile([], 0.5), 0.0)
+
+    def test_model_scale_kind(self):
+        products = benchmark.load_products('data/test_products.txt', 2, 'model')
+        self.assertEqual(len(products), 6)
+        self.assertEqual(products[3].manufacturer_pure, products[0].manufacturer_pure)
+        self.assertEqual(products[3].family_pure, products[0].family_pure)
+        self.assertEqual(products[3].model_pure, products[0].model_pure + u'synthetic1')
+        search_tree = benchmark.build_search_tree(products)
+        self.assertEqual(search_tree.lookup(products[3]).data, products[3])
+
+    @unittest.skipUnless(os.environ.get('GOLDEN_TESTS'), 'set GOLDEN_TESTS=1 to match the full data set against the golden baseline')
+    def test_full_pipeline_matches_golden(self):
+        # Any change to the tree or the ranking must leave every listing's match decision untouched.
+        golden = benchmark.read_golden()
+        listing_rows = benchmark.load_listings()
+        for mode in benchmark.MODES:
+            tree = benchmark.build_tree(benchmark.load_products(), mode)
+            decisions, latencies, match_time = benchmark.run_matches(tree, listing_rows)
+            self.assertEqual(benchmark.compare(decisions, golden), [])
+
 if __name__ == '__main__':
     
     unittest.main()